@@ -2,18 +2,23 @@ from __future__ import annotations
 
 """FastAPI application entry-point for the recipe chatbot."""
 
+import json
 from pathlib import Path
-from typing import Final, List, Dict
+from typing import Final, Iterator, Optional
 
 from fastapi import FastAPI, HTTPException, status
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
 import uuid
 import pandas as pd
 from datetime import datetime
 
-from backend.utils import get_agent_response  # noqa: WPS433 import from parent
+from backend.utils import (  # noqa: WPS433 import from parent
+    get_agent_response,
+    get_agent_response_stream,
+    get_session_history,
+)
 
 # -----------------------------------------------------------------------------
 # Application setup
@@ -37,15 +42,21 @@ class ChatMessage(BaseModel):
     content: str = Field(..., description="Content of the message.")
 
 class ChatRequest(BaseModel):
-    """Schema for incoming chat messages."""
+    """Schema for incoming chat messages.
 
-    messages: List[ChatMessage] = Field(..., description="The entire conversation history.")
+    History is kept server-side, so each request only carries the new user
+    turn plus the session it belongs to.
+    """
+
+    session_id: Optional[str] = Field(None, description="Conversation identifier; omit to start a new session.")
+    message: str = Field(..., description="The user's new message.")
 
 
 class ChatResponse(BaseModel):
     """Schema for the assistant's reply returned to the front-end."""
 
-    messages: List[ChatMessage] = Field(..., description="The updated conversation history.")
+    session_id: str = Field(..., description="Conversation identifier to send with the next turn.")
+    message: ChatMessage = Field(..., description="The assistant's reply.")
 
 
 # -----------------------------------------------------------------------------
@@ -57,13 +68,12 @@ class ChatResponse(BaseModel):
 async def chat_endpoint(payload: ChatRequest) -> ChatResponse:  # noqa: WPS430
     """Main conversational endpoint.
 
-    It proxies the user's message list to the underlying agent and returns the updated list.
+    It proxies the user's new message to the underlying agent and returns the reply.
     """
-    # Convert Pydantic models to simple dicts for the agent
-    request_messages: List[Dict[str, str]] = [msg.model_dump() for msg in payload.messages]
+    session_id = payload.session_id or str(uuid.uuid4())
 
     try:
-        updated_messages_dicts = get_agent_response(request_messages)
+        assistant_reply = get_agent_response(session_id, payload.message)
     except Exception as exc:  # noqa: BLE001 broad; surface as HTTP 500
         # In production you would log the traceback here.
         raise HTTPException(
@@ -71,14 +81,38 @@ async def chat_endpoint(payload: ChatRequest) -> ChatResponse:  # noqa: WPS430
             detail=str(exc),
         ) from exc
 
-    # Convert dicts back to Pydantic models for the response
-    response_messages: List[ChatMessage] = [ChatMessage(**msg) for msg in updated_messages_dicts]
-    response_messages_df = pd.DataFrame(response_messages)
-    # Save the conversation history to a CSV file
+    # Save the server-side conversation history to a CSV file
+    response_messages_df = pd.DataFrame(get_session_history(session_id))
     print("saving conversation history to CSV")
     id = datetime.now().strftime("%Y%m%d%H%M%S")
     response_messages_df.to_csv(f"conversation_history_{id}.csv", index=False)
-    return ChatResponse(messages=response_messages)
+    return ChatResponse(
+        session_id=session_id,
+        message=ChatMessage(role="assistant", content=assistant_reply),
+    )
+
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(payload: ChatRequest) -> StreamingResponse:  # noqa: WPS430
+    """Streaming variant of the conversational endpoint.
+
+    Forwards assistant tokens to the client as Server-Sent Events the moment
+    the provider produces them, so the first token shows up in ~hundreds of
+    milliseconds instead of after the full completion is built.
+    """
+    session_id = payload.session_id or str(uuid.uuid4())
+
+    def event_generator() -> Iterator[str]:
+        try:
+            # First frame tells a new client which session it was assigned.
+            yield f"data: {json.dumps({'session_id': session_id})}\n\n"
+            for token in get_agent_response_stream(session_id, payload.message):
+                yield f"data: {json.dumps({'content': token})}\n\n"
+            yield "data: [DONE]\n\n"
+        except Exception as exc:  # noqa: BLE001 broad; surface to the client stream
+            yield f"data: {json.dumps({'error': str(exc)})}\n\n"
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
 
 
 @app.get("/", response_class=HTMLResponse)
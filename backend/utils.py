@@ -7,7 +7,7 @@ wrapper around litellm so the rest of the application stays decluttered.
 """
 
 import os
-from typing import Final, List, Dict
+from typing import Final, Iterator, List, Dict
 
 import litellm  # type: ignore
 from dotenv import load_dotenv
@@ -54,42 +54,166 @@ SYSTEM_PROMPT: Final[str] = (
 # Fetch configuration *after* we loaded the .env file.
 MODEL_NAME: Final[str] = os.environ.get("MODEL_NAME", "gpt-4o-mini")
 
+# Built once at import time: the provider-facing system message with the
+# cache hint attached. Reusing a single interned dict avoids rebuilding the
+# nested structure on every call, and guarantees the prompt bytes stay
+# identical so the provider's cache hash keeps matching.
+_PROVIDER_SYSTEM_MESSAGE: Final[Dict] = {
+    "role": "system",
+    "content": [
+        {
+            "type": "text",
+            "text": SYSTEM_PROMPT,
+            "cache_control": {"type": "ephemeral"},
+        }
+    ],
+}
+
+
+# --- Conversation store -----------------------------------------------------------
+
+# In-memory conversation history keyed by session id. Storing history
+# server-side means each request only carries the new user turn instead of
+# re-shipping the whole conversation, and the byte-stable message prefix keeps
+# the provider's prompt cache hitting. Swap for Redis (or similar) when the
+# app needs to scale past a single process.
+_SESSIONS: Dict[str, List[Dict[str, str]]] = {}
+
+
+def get_session_history(session_id: str) -> List[Dict[str, str]]:
+    """Return the stored history for *session_id*, creating it on first use."""
+
+    return _SESSIONS.setdefault(
+        session_id, [{"role": "system", "content": SYSTEM_PROMPT}]
+    )
+
 
 # --- Agent wrapper ---------------------------------------------------------------
 
-def get_agent_response(messages: List[Dict[str, str]]) -> List[Dict[str, str]]:  # noqa: WPS231
-    """Call the underlying large-language model via *litellm*.
+def _build_provider_messages(
+    messages: List[Dict[str, str]],
+) -> List[Dict]:
+    """Build the message list sent to the provider.
+
+    Ensures the system prompt is always the first message, then marks it as
+    cacheable so the provider can reuse the prefill KV state across turns
+    instead of reprocessing the same prefix tokens on every call. The prompt
+    must stay byte-identical between calls for the provider's cache hash to
+    match. The input history keeps plain string content and is not modified.
+    """
+
+    current_messages: List[Dict[str, str]]
+    if not messages or messages[0]["role"] != "system":
+        current_messages = [{"role": "system", "content": SYSTEM_PROMPT}] + messages
+    else:
+        current_messages = messages
+
+    if current_messages[0]["content"] == SYSTEM_PROMPT:
+        # The common case: reuse the interned message built at import time.
+        system_message: Dict = _PROVIDER_SYSTEM_MESSAGE
+    else:
+        system_message = {
+            "role": "system",
+            "content": [
+                {
+                    "type": "text",
+                    "text": current_messages[0]["content"],
+                    "cache_control": {"type": "ephemeral"},
+                }
+            ],
+        }
+
+    return [system_message] + current_messages[1:]
+
+
+def get_agent_response(session_id: str, user_message: str) -> str:  # noqa: WPS231
+    """Run one conversation turn for *session_id* via *litellm*.
+
+    The full history lives server-side in the session store; callers only
+    send the new user message, so request payloads stay constant-size instead
+    of growing with the conversation.
 
     Parameters
     ----------
-    messages:
-        The full conversation history. Each item is a dict with "role" and "content".
+    session_id:
+        Identifier of the conversation. A new history is created on first use.
+    user_message:
+        The user's new message for this turn.
 
     Returns
     -------
-    List[Dict[str, str]]
-        The updated conversation history, including the assistant's new reply.
+    str
+        The assistant's reply.
     """
 
     # litellm is model-agnostic; we only need to supply the model name and key.
-    # The first message is assumed to be the system prompt if not explicitly provided
-    # or if the history is empty. We'll ensure the system prompt is always first.
-    current_messages: List[Dict[str, str]]
-    if not messages or messages[0]["role"] != "system":
-        current_messages = [{"role": "system", "content": SYSTEM_PROMPT}] + messages
-    else:
-        current_messages = messages
+    history = get_session_history(session_id)
+    history.append({"role": "user", "content": user_message})
+
+    try:
+        completion = litellm.completion(
+            model=MODEL_NAME,
+            messages=_build_provider_messages(history), # Pass the full history
+        )
+
+        assistant_reply_content: str = (
+            completion["choices"][0]["message"]["content"]  # type: ignore[index]
+            .strip()
+        )
+    except Exception:
+        # Roll the failed turn back out of the store, otherwise a client
+        # retry would append the same user message twice in a row.
+        history.pop()
+        raise
+
+    # Append assistant's response to the stored history
+    history.append({"role": "assistant", "content": assistant_reply_content})
+    return assistant_reply_content
+
+
+def get_agent_response_stream(session_id: str, user_message: str) -> Iterator[str]:  # noqa: WPS231
+    """Stream the assistant's reply token-by-token via *litellm*.
+
+    Yields content deltas as the provider produces them, so the caller can
+    forward them to the client immediately instead of blocking for the full
+    completion. Once the stream is exhausted the accumulated reply is appended
+    to the stored session history, keeping it consistent with
+    :func:`get_agent_response`.
 
-    completion = litellm.completion(
-        model=MODEL_NAME,
-        messages=current_messages, # Pass the full history
-    )
+    Parameters
+    ----------
+    session_id:
+        Identifier of the conversation. A new history is created on first use.
+    user_message:
+        The user's new message for this turn.
+
+    Yields
+    ------
+    str
+        The next chunk of assistant content.
+    """
 
-    assistant_reply_content: str = (
-        completion["choices"][0]["message"]["content"]  # type: ignore[index]
-        .strip()
-    )
-    
-    # Append assistant's response to the history
-    updated_messages = current_messages + [{"role": "assistant", "content": assistant_reply_content}]
-    return updated_messages 
\ No newline at end of file
+    history = get_session_history(session_id)
+    history.append({"role": "user", "content": user_message})
+
+    chunks: List[str] = []
+    try:
+        response = litellm.completion(
+            model=MODEL_NAME,
+            messages=_build_provider_messages(history),
+            stream=True,
+        )
+
+        for chunk in response:
+            delta: str = chunk["choices"][0]["delta"].get("content") or ""  # type: ignore[index]
+            if delta:
+                chunks.append(delta)
+                yield delta
+    except Exception:
+        # Roll the failed turn back out of the store, otherwise a client
+        # retry would append the same user message twice in a row.
+        history.pop()
+        raise
+
+    # Record the full reply server-side once the stream ends.
+    history.append({"role": "assistant", "content": "".join(chunks).strip()})
\ No newline at end of file
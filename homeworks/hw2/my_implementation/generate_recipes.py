@@ -1,47 +1,34 @@
+import sys
+from pathlib import Path
+
+# Add project root to sys.path so the shared backend package is importable
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import asyncio
+import orjson
+import time
 import dspy
+import litellm
 import pandas as pd
 from dotenv import load_dotenv
+from openai import OpenAI
 import os
 from typing import Callable
-from typing import List
+from typing import List, Dict
 import mlflow
-from tqdm import tqdm
-
-
-load_dotenv()
-
-
-SYSTEM_PROMPT = """You are an expert chef like Yotam Ottolenghi, Eric Kim or Hetty Lui McKinnon recommending delicious and useful recipes in the style of NYTCooking. 
-    Present only one recipe at a time. 
-
-    1. Introduction
-    Include a brief evocative introductory paragraph about the recipe that includes possible substitutions and key callouts that the user should know about.
-
-    EXAMPLE INTRODUCTORY PARAGRAPHS:
-    - Garlicky, gingery and full of bright flavors, this panacea will heal you from within. The amount of spice is up to you, but know that a little red chile lends immeasurable flavor in addition to heat. If your ginger root is especially young and tender, consider peeling then cutting it into fine 1-inch matchsticks to eat in the soup for an even deeper, punchier warmth. White beans offer protein in this brothy meal, which becomes even heartier with the addition of white rice or noodles. (You can also sop it up with a slice of cornbread.) Reheat this nourishing soup throughout the week, adding more broth and various crisper-drawer vegetables you need to use up, like cabbage, kale, arugula, watercress and bean sprouts. Quick-cooking proteins like shrimp and tofu taste great in place of the beans, too. 
-    - The first recipe for beef stroganoff dates back to the 1800s and is rumored to have Russian aristocratic origins. This version is a bold, modern vegetarian reimagination that is rich and decadent, thanks to the magic of mushrooms, which deliver walloping umami. A variety of mushrooms adds a nice mix of textures, but a similarly intense dish can be created with just one type.
+from tqdm.asyncio import tqdm as async_tqdm
 
-    2. Steps
-    Include a numbered list of steps to prepare the recipe. 
+from backend.utils import SYSTEM_PROMPT
 
-    EXAMPLE STEPS:
-    # Step 1
-    To a medium pot, add the kimchi, stock, garlic, ginger, gochugaru, fish sauce and doenjang. Set over high heat until boiling. Partially cover, reduce the heat to medium-low and gently boil, stirring occasionally, until the broth is aromatic, 8 to 10 minutes.
 
-    # Step 2
-    Stir in the beans and onion and continue simmering until warmed through, about 5 minutes. Taste and adjust seasonings, if needed, with salt, gochugaru and fish sauce. Before serving, discard the ginger if you don’t want to eat it and stir in the cilantro.
+load_dotenv()
 
-    3. Tips
-    Include a tips section giving advice on unusual ingredients, substitutions, and ideas for how to repurpose leftovers.
-    
-    EXAMPLE TIPS:
-    - Kimchi is sold in many ways and at varying stages of ripeness. For this dish, you want very ripe, well-fermented kimchi for the brightest flavor. Less fermented kimchi will taste like fresh cabbage, whereas well-fermented kimchi will taste sharp and pickled, with small bubbles signaling fermentation. To ferment less ripened kimchi from the store, leave it on the counter in its covered jar at room temperature until it starts to effervesce and smell funky, overnight or up to 48 hours. Return to the refrigerator before using.
-    - Reheat this nourishing soup throughout the week, adding more broth and various crisper-drawer vegetables you need to use up, like cabbage, kale, arugula, watercress and bean sprouts. Quick-cooking proteins like shrimp and tofu taste great in place of the beans, too.
-    - Achieve even deeper layers of flavor by soaking a handful of dried porcini mushrooms in one cup of hot water for 10 to 15 minutes, then adding the mushrooms and soaking liquid, which can replace the vegetable stock, to the dish. Crème fraîche is naturally thick and imparts a velvety tang to the dish, but use sour cream if you prefer. (Vegans can use cashew or coconut cream).
 
-    DO NOT DO THIS:
-    1. misclassify ingredients, for example saying that feta is vegan, or that a recipe is gluten free when it contains gluten
-    """
+MODEL_NAME = "openai/gpt-4o-mini"
+MAX_CONCURRENT_REQUESTS = 10  # Cap in-flight requests so we stay under provider rate limits
+BATCH_FILE_PATH = Path(__file__).parent / "batch.jsonl"
+BATCH_POLL_INTERVAL_SECONDS = 30
 
 
 def configure_lm() -> None:
@@ -64,19 +51,163 @@ def create_dspy_program() -> Callable[[str], str]:
     )
     return generate
 
-def get_responses(queries: List[str], generate: Callable[[str], str]) -> List[str]:
-    """Generate responses for the given queries.
+def get_responses_dspy(queries: List[str], generate: Callable[[str], str]) -> List[Dict[str, str]]:
+    """Generate responses through the DSPy program using its batch executor.
+
+    Alternative to :func:`get_responses` for runs that want DSPy/MLflow
+    tracing. `Predict.batch` fans the queries out across worker threads
+    instead of looping over them serially.
 
     Args:
         queries (List[str]): A list of query strings.
-        generate (Callable[[str], str]): A function that generates a recipe from a query.
+        generate (Callable[[str], str]): The DSPy program from create_dspy_program.
 
     Returns:
-        List[str]: A list of generated recipe strings.
+        List[Dict[str, str]]: One {"query", "recipe"} dict per input query, in order.
     """
     mlflow.dspy.autolog()
-    responses = [{"query": q, "recipe": generate(question=q).recipe} for q in tqdm(queries, desc="Generating recipes")]
-    return responses
+    examples = [dspy.Example(question=q).with_inputs("question") for q in queries]
+    predictions, failed_examples, _ = generate.batch(
+        examples,
+        num_threads=MAX_CONCURRENT_REQUESTS,
+        return_failed_examples=True,
+    )
+    if failed_examples:
+        print(f"{len(failed_examples)} queries failed during DSPy batch generation")
+    # Failed examples come back as None in the results; mark them instead of
+    # crashing on p.recipe
+    return [
+        {"query": q, "recipe": p.recipe if p is not None else "Error: generation failed"}
+        for q, p in zip(queries, predictions)
+    ]
+
+
+async def get_responses(queries: List[str]) -> List[Dict[str, str]]:
+    """Generate responses for the given queries concurrently.
+
+    The workload is network-IO-bound, so instead of looping over queries one
+    at a time we fire all requests via `litellm.acompletion` and gather them,
+    with a semaphore capping how many are in flight at once.
+
+    Args:
+        queries (List[str]): A list of query strings.
+
+    Returns:
+        List[Dict[str, str]]: One {"query", "recipe"} dict per input query, in order.
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+    async def generate_recipe(query: str) -> str:
+        async with semaphore:
+            try:
+                response = await litellm.acompletion(
+                    model=MODEL_NAME,
+                    messages=[
+                        # The system prompt is identical for all 40 queries, so
+                        # mark it cacheable and let the provider reuse its
+                        # prefill KV state instead of reprocessing it per call.
+                        {
+                            "role": "system",
+                            "content": [
+                                {
+                                    "type": "text",
+                                    "text": SYSTEM_PROMPT,
+                                    "cache_control": {"type": "ephemeral"},
+                                }
+                            ],
+                        },
+                        {"role": "user", "content": query},
+                    ],
+                )
+                return response.choices[0].message.content
+            except Exception as e:
+                return f"Error generating recipe: {str(e)}"
+
+    tasks = [generate_recipe(q) for q in queries]
+    recipes = await async_tqdm.gather(*tasks, desc="Generating recipes")
+    return [{"query": q, "recipe": r} for q, r in zip(queries, recipes)]
+
+
+def get_responses_batch(queries: List[str]) -> List[Dict[str, str]]:
+    """Generate responses through OpenAI's server-side batch endpoint.
+
+    This script is an offline evaluation run, not a latency-sensitive one, so
+    instead of paying for interactive per-request capacity we write every
+    prompt into a JSONL batch file, submit it as a single job, poll until it
+    completes, and read the results back. Batch jobs are an order of magnitude
+    cheaper and let the provider schedule the work efficiently.
+
+    Args:
+        queries (List[str]): A list of query strings.
+
+    Returns:
+        List[Dict[str, str]]: One {"query", "recipe"} dict per input query, in order.
+    """
+    client = OpenAI()
+    batch_model = MODEL_NAME.split("/")[-1]  # Batch bodies want the bare OpenAI model name
+
+    # orjson writes raw UTF-8 (no \u escapes for accents or emojis), which
+    # keeps the batch file smaller and serializes faster than stdlib json
+    with BATCH_FILE_PATH.open("wb") as f:
+        for i, query in enumerate(queries):
+            request = {
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": batch_model,
+                    "messages": [
+                        {"role": "system", "content": SYSTEM_PROMPT},
+                        {"role": "user", "content": query},
+                    ],
+                },
+            }
+            f.write(orjson.dumps(request) + b"\n")
+
+    with BATCH_FILE_PATH.open("rb") as f:
+        input_file = client.files.create(file=f, purpose="batch")
+
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    print(f"Submitted batch {batch.id}, polling for completion...")
+
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        time.sleep(BATCH_POLL_INTERVAL_SECONDS)
+        batch = client.batches.retrieve(batch.id)
+        print(f"Batch {batch.id} status: {batch.status}")
+
+    if batch.status != "completed":
+        raise RuntimeError(f"Batch {batch.id} ended with status '{batch.status}'")
+
+    # Results come back in completion order, so key them by custom_id to
+    # reconstruct the original query ordering.
+    output = client.files.content(batch.output_file_id)
+    recipes_by_id: Dict[str, str] = {}
+    for line in output.text.splitlines():
+        result = orjson.loads(line)
+        if result.get("error"):
+            print(f"Batch request {result['custom_id']} failed: {result['error']}")
+            continue
+        content = result["response"]["body"]["choices"][0]["message"]["content"]
+        recipes_by_id[result["custom_id"]] = content
+
+    # Requests that errored out land in a separate error file; log those too
+    # so failures are visible instead of silently missing from the output.
+    if batch.error_file_id:
+        errors = client.files.content(batch.error_file_id)
+        for line in errors.text.splitlines():
+            error = orjson.loads(line)
+            print(f"Batch request {error.get('custom_id')} failed: {error.get('error')}")
+
+    # Failed requests get an explicit error marker, matching the async path,
+    # rather than a blank recipe indistinguishable from success.
+    return [
+        {"query": q, "recipe": recipes_by_id.get(str(i), "Error: batch request failed; see logs")}
+        for i, q in enumerate(queries)
+    ]
 
 
 if __name__ == "__main__":
@@ -84,20 +215,29 @@ if __name__ == "__main__":
     mlflow.set_experiment("dspy-experiment")
     # mlflow.dspy.autolog()
 
-    queries = pd.read_csv('homeworks/hw2/my_implementation/synthetic_queries_for_analysis.csv')["query"].tolist()[0:40]
-
-    print("Configuring DSPy language model...")
-    configure_lm()
-
-    print("Creating DSPy program for recipe generation...")
-    generate = create_dspy_program()
-
-    
-    # Generate responses for the queries
+    # Only the query column and the first 40 rows are needed, so don't parse
+    # the rest of the file
+    queries = pd.read_csv(
+        'homeworks/hw2/my_implementation/synthetic_queries_for_analysis.csv',
+        usecols=["query"],
+        nrows=40,
+    )["query"].tolist()
+
+    # Generate responses for the queries. The batch endpoint is the cheap
+    # offline path, the DSPy path keeps MLflow tracing, and the async path
+    # (default) is fastest when results are needed now.
     print("Generating recipes for the queries...")
-    responses = get_responses(queries, generate)
+    if os.environ.get("USE_BATCH_API"):
+        responses = get_responses_batch(queries)
+    elif os.environ.get("USE_DSPY"):
+        print("Configuring DSPy language model...")
+        configure_lm()
+        generate = create_dspy_program()
+        responses = get_responses_dspy(queries, generate)
+    else:
+        responses = asyncio.run(get_responses(queries))
     
     # Save the responses to a CSV file
     print("Saving generated recipes to 'generated_recipes.csv'...")
-    pd.DataFrame(responses).to_csv("homeworks/hw2/my_implementation/generated_recipes.csv", index=False)
+    pd.DataFrame(responses).to_csv("homeworks/hw2/my_implementation/generated_recipes.csv", index=False, encoding="utf-8")
     print("Recipes generated and saved to 'generated_recipes.csv'.")
\ No newline at end of file
@@ -1,15 +1,17 @@
 from pydantic import BaseModel
 
+import asyncio
+import csv
+import hashlib
 import os
-import json
+import orjson
 from pathlib import Path
-from typing import List, Dict, Any
-import pandas as pd
-from litellm import completion
+from typing import AsyncIterator, List, Dict, Any, Optional
+from litellm import acompletion, APIConnectionError, RateLimitError, Timeout
 from dotenv import load_dotenv
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import time
-from tqdm import tqdm
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
+from tqdm.asyncio import tqdm
 
 load_dotenv()
 
@@ -27,43 +29,98 @@ class QueryWithDimensions(BaseModel):
     is_realistic_and_kept: int = 1
     notes_for_filtering: str = ""
 
-class DimensionTuplesList(BaseModel):
-    tuples: List[DimensionTuple]
-
-class QueriesList(BaseModel):
+class TupleWithQueries(BaseModel):
+    dimension_tuple: DimensionTuple
     queries: List[str]
 
 MODEL_NAME = "gpt-4o-mini"
 NUM_TUPLES_TO_GENERATE = 20
 NUM_QUERIES_PER_TUPLE = 5
 OUTPUT_CSV_PATH = Path(__file__).parent / "synthetic_queries_for_analysis.csv"
-MAX_WORKERS = 5  # Number of parallel LLM calls
-
-def call_llm(messages: List[Dict[str, str]], response_format: Any) -> Any:
-    """Make a single LLM call with retries."""
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            response = completion(
-                model=MODEL_NAME,
-                messages=messages,
-                response_format=response_format
-            )
-            return response_format(**json.loads(response.choices[0].message.content))
-        except Exception as e:
-            if attempt == max_retries - 1:
-                raise e
-            time.sleep(1)  # Wait before retry
-
-def generate_dimension_tuples():
-    """Create a dimension tuple object from the given parameters. The DimensionTuple class 
-    will then be used to generate synthetic queries for recipe generation."""
-
-    PROMPT = """You are helping to generate synthetic queries for recipe generation. Recipes are meant to reflect 
+CACHE_DIR = Path(__file__).parent / ".llm_cache"
+MAX_WORKERS = 5  # Number of concurrent LLM calls
+MAX_RETRIES = 3
+
+def _dimension_key(tup: DimensionTuple) -> tuple:
+    """Normalized identity of a dimension tuple for deduplication.
+
+    Ingredients are lowercased, stripped, and sorted so the same combination
+    in a different order, case, or with stray whitespace doesn't count as a
+    distinct tuple.
+    """
+    return (
+        tup.occasion,
+        tup.author_style,
+        tuple(sorted(i.lower().strip() for i in tup.ingredients)),
+        tup.cooking_method,
+    )
+
+def _cache_key(messages: List[Dict[str, str]], response_format: Any) -> str:
+    """Stable key over the prompt and the expected response schema."""
+    payload = orjson.dumps({
+        "model": MODEL_NAME,
+        "messages": messages,
+        "response_format": response_format.__name__,
+    })
+    return hashlib.sha256(payload).hexdigest()
+
+@retry(
+    retry=retry_if_exception_type((RateLimitError, APIConnectionError, Timeout)),
+    stop=stop_after_attempt(MAX_RETRIES),
+    wait=wait_exponential_jitter(initial=1, max=30),
+    reraise=True,
+)
+async def _call_llm_uncached(messages: List[Dict[str, str]], response_format: Any) -> Any:
+    """Make a single LLM call with retries.
+
+    The calls are network-bound, so they run as coroutines on the event loop
+    rather than tying up a thread each while waiting on the provider. Only
+    transient failures (rate limits, connection drops, timeouts) are retried;
+    fatal ones like a malformed request or bad API key surface immediately.
+    Retries back off exponentially with jitter so concurrent callers hitting
+    a rate limit don't all retry in lockstep and trip it again.
+    """
+    response = await acompletion(
+        model=MODEL_NAME,
+        messages=messages,
+        response_format=response_format
+    )
+    # orjson parses straight to dict noticeably faster than stdlib json and
+    # handles the UTF-8 payload (emojis, accented ingredients) natively
+    return response_format(**orjson.loads(response.choices[0].message.content))
+
+async def call_llm(messages: List[Dict[str, str]], response_format: Any) -> Any:
+    """Make an LLM call, serving repeats from a local disk cache.
+
+    Responses are cached on disk keyed by a sha256 of the prompt and the
+    response schema, so re-running the script (e.g. while iterating on the
+    downstream filtering) skips the network for prompts it has already paid
+    for. Delete the cache directory to force regeneration.
+    """
+    CACHE_DIR.mkdir(exist_ok=True)
+    cache_path = CACHE_DIR / f"{_cache_key(messages, response_format)}.json"
+    if cache_path.exists():
+        return response_format(**orjson.loads(cache_path.read_bytes()))
+
+    result = await _call_llm_uncached(messages, response_format)
+    cache_path.write_bytes(orjson.dumps(result.model_dump()))
+    return result
+
+async def generate_tuple_with_queries(variation: int) -> Optional[TupleWithQueries]:
+    """Generate one dimension tuple together with its queries in a single call.
+
+    Fusing the two pipeline stages halves the round-trips per tuple: the model
+    invents the tuple and writes its queries in the same response, instead of
+    a second call re-sending the tuple it just produced. The *variation*
+    number is woven into the prompt so concurrent calls aren't byte-identical,
+    which nudges diversity and gives each slot its own cache key."""
+
+    prompt = f"""You are helping to generate synthetic queries for recipe generation. Recipes are meant to reflect
     the style of various NYTimes Cooking authors, and the queries should be realistic and diverse.
 
-    You will be given a set of parameters that describe the query, and you will return a
-    DimensionTuple object that contains the occasion, author style, ingredients, and cooking method.
+    You will be given a set of parameters that describe the query, and you will first build a
+    DimensionTuple object that contains the occasion, author style, ingredients, and cooking method,
+    then write natural language queries based on that tuple.
 
     Important: Aim for an even distribution across all dimensions. For example:
     - Don't focus too heavily on quick recipes
@@ -142,47 +199,11 @@ def generate_dimension_tuples():
     ingredients: fish, quinoa, zuchini
     cooking_method: sautéing}}
 
-    Generate {NUM_TUPLES_TO_GENERATE} unique dimension tuples following these patterns. Remember to maintain balanced diversity across all dimensions.
-    """
-    messages = [{"role": "user", "content": PROMPT}]
+    This is variation {variation} of {NUM_TUPLES_TO_GENERATE}; pick a dimension combination that variation number
+    {variation} would plausibly land on so the full set stays diverse.
 
-    try:
-        print("Generating dimension tuples in parallel...")
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            # Submit five generation tasks using a loop
-            futures = []
-            for _ in range(5):
-                futures.append(executor.submit(call_llm, messages, DimensionTuplesList))
-            
-            # Wait for all to complete and collect results
-            responses = []
-            for future in futures:
-                responses.append(future.result())
-        
-        # Combine tuples and remove duplicates
-        all_tuples = []
-        for response in responses:
-            all_tuples.extend(response.tuples)
-        unique_tuples = []
-        seen = set()
-        
-        for tup in all_tuples:
-            # Convert tuple to a comparable string representation
-            tuple_str = tup.model_dump_json()
-            if tuple_str not in seen:
-                seen.add(tuple_str)
-                unique_tuples.append(tup)
-        
-        print(f"Generated {len(all_tuples)} total tuples, {len(unique_tuples)} unique")
-        return unique_tuples
-    except Exception as e:
-        print(f"Error generating dimension tuples: {e}")
-        return []
-    
-def generate_queries_for_tuple(dimension_tuple: DimensionTuple) -> List[str]:
-    """Generate natural language queries for a given dimension tuple."""
-    prompt = f"""Generate {NUM_QUERIES_PER_TUPLE} different natural language queries for a recipe chatbot based on these characteristics:
-{dimension_tuple.model_dump_json(indent=2)}
+    Pick ONE dimension tuple following these patterns, maintaining balanced diversity across all dimensions,
+    then generate {NUM_QUERIES_PER_TUPLE} different natural language queries for a recipe chatbot based on that tuple.
 
 The queries should:
 1. Sound like real users asking for recipe help
@@ -219,101 +240,127 @@ With emojis/text speak:
 - "need lunch! 🥗"
 - "chocolate dessert ideas plz 🍫"
 
-Generate {NUM_QUERIES_PER_TUPLE} unique queries that match the given dimensions, varying the text style naturally."""
+Return the chosen dimension tuple together with its {NUM_QUERIES_PER_TUPLE} unique queries, varying the text style naturally."""
 
     messages = [{"role": "user", "content": prompt}]
-    
+
     try:
-        response = call_llm(messages, QueriesList)
-        return response.queries
+        return await call_llm(messages, TupleWithQueries)
     except Exception as e:
-        print(f"Error generating queries for tuple: {e}")
-        return []
+        print(f"Error generating tuple with queries: {e}")
+        return None
 
-def generate_queries_parallel(dimension_tuples: List[DimensionTuple]) -> List[QueryWithDimensions]:
-    """Generate queries in parallel for all dimension tuples."""
-    all_queries = []
-    query_id = 1
-    
-    print(f"Generating {NUM_QUERIES_PER_TUPLE} queries each for {len(dimension_tuples)} dimension tuples...")
-    
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        # Submit all query generation tasks
-        future_to_tuple = {
-            executor.submit(generate_queries_for_tuple, dim_tuple): i 
-            for i, dim_tuple in enumerate(dimension_tuples)
-        }
-        
-        # Process completed generations as they finish
-        with tqdm(total=len(dimension_tuples), desc="Generating Queries") as pbar:
-            for future in as_completed(future_to_tuple):
-                tuple_idx = future_to_tuple[future]
-                try:
-                    queries = future.result()
-                    if queries:
-                        for query in queries:
-                            all_queries.append(QueryWithDimensions(
-                                id=f"SYN{query_id:03d}",
-                                query=query,
-                                dimension_tuple=dimension_tuples[tuple_idx]
-                            ))
-                            query_id += 1
-                    pbar.update(1)
-                except Exception as e:
-                    print(f"Tuple {tuple_idx + 1} generated an exception: {e}")
-                    pbar.update(1)
-    
-    return all_queries
+async def generate_queries_parallel(num_tuples: int = NUM_TUPLES_TO_GENERATE) -> AsyncIterator[QueryWithDimensions]:
+    """Generate dimension tuples and their queries concurrently.
+
+    Each task is one fused LLM call that returns a tuple plus its queries.
+    Since the calls are independent, repeated tuples can come back; they are
+    deduplicated as results arrive and their queries dropped.
 
-def save_queries_to_csv(queries: List[QueryWithDimensions]):
-    """Save generated queries to CSV using pandas."""
-    if not queries:
+    Queries are yielded as each call completes, so the full set never has to
+    sit in memory and callers can stream rows straight to disk."""
+    query_id = 1
+    semaphore = asyncio.Semaphore(MAX_WORKERS)
+    seen = set()
+
+    print(f"Generating {num_tuples} dimension tuples with {NUM_QUERIES_PER_TUPLE} queries each...")
+
+    async def generate_one(tuple_idx: int) -> Optional[TupleWithQueries]:
+        async with semaphore:
+            try:
+                return await generate_tuple_with_queries(tuple_idx + 1)
+            except Exception as e:
+                print(f"Tuple {tuple_idx + 1} generated an exception: {e}")
+                return None
+
+    tasks = [asyncio.ensure_future(generate_one(i)) for i in range(num_tuples)]
+
+    # Process completed generations as they finish; tqdm wraps as_completed
+    # and ticks the bar itself, so no manual update bookkeeping
+    for future in tqdm.as_completed(tasks, total=num_tuples, desc="Generating Queries"):
+        result = await future
+        if result is not None and result.queries:
+            tup = result.dimension_tuple
+            key = _dimension_key(tup)
+            if key not in seen:
+                seen.add(key)
+                for query in result.queries:
+                    yield QueryWithDimensions(
+                        id=f"SYN{query_id:03d}",
+                        query=query,
+                        dimension_tuple=tup
+                    )
+                    query_id += 1
+
+async def save_queries_to_csv(queries: AsyncIterator[QueryWithDimensions]) -> int:
+    """Stream generated queries to CSV as they arrive.
+
+    Each row is written the moment its query is produced, so memory stays
+    flat no matter how many tuples are generated. Returns the number of rows
+    written.
+    """
+    # All queries from the same tuple carry the same dimensions, so serialize
+    # each distinct tuple once instead of once per query row. Keyed by the
+    # tuple's field values, not object identity, so a freed-and-reused id
+    # can never serve a stale entry.
+    tuple_json_cache: Dict[tuple, str] = {}
+
+    def dimension_tuple_json(dim_tuple: DimensionTuple) -> str:
+        key = _dimension_key(dim_tuple)
+        if key not in tuple_json_cache:
+            tuple_json_cache[key] = dim_tuple.model_dump_json()
+        return tuple_json_cache[key]
+
+    fieldnames = ['id', 'query', 'dimension_tuple_json', 'is_realistic_and_kept', 'notes_for_filtering']
+    num_written = 0
+
+    # Stream into a temp file and only swap it over the real output once at
+    # least one row exists, so a run where every call fails can't truncate a
+    # previously good CSV down to a header-only file.
+    tmp_path = OUTPUT_CSV_PATH.with_suffix(".csv.tmp")
+
+    # Write UTF-8 directly so emojis and accented ingredients don't get escaped
+    with tmp_path.open("w", newline="", encoding="utf-8") as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
+        writer.writeheader()
+        async for q in queries:
+            writer.writerow({
+                'id': q.id,
+                'query': q.query,
+                'dimension_tuple_json': dimension_tuple_json(q.dimension_tuple),
+                'is_realistic_and_kept': q.is_realistic_and_kept,
+                'notes_for_filtering': q.notes_for_filtering
+            })
+            num_written += 1
+
+    if not num_written:
+        tmp_path.unlink()
         print("No queries to save.")
-        return
+        return 0
 
-    # Convert to DataFrame
-    df = pd.DataFrame([
-        {
-            'id': q.id,
-            'query': q.query,
-            'dimension_tuple_json': q.dimension_tuple.model_dump_json(),
-            'is_realistic_and_kept': q.is_realistic_and_kept,
-            'notes_for_filtering': q.notes_for_filtering
-        }
-        for q in queries
-    ])
-    
-    # Save to CSV
-    df.to_csv(OUTPUT_CSV_PATH, index=False)
-    print(f"Saved {len(queries)} queries to {OUTPUT_CSV_PATH}")
+    tmp_path.replace(OUTPUT_CSV_PATH)
+    print(f"Saved {num_written} queries to {OUTPUT_CSV_PATH}")
+    return num_written
 
-def main():
+async def main():
     """Main function to generate and save queries."""
     if "OPENAI_API_KEY" not in os.environ:
         print("Error: OPENAI_API_KEY environment variable not set.")
         return
 
     start_time = time.time()
-    
-    # Step 1: Generate dimension tuples
-    print("Step 1: Generating dimension tuples...")
-    dimension_tuples = generate_dimension_tuples()
-    if not dimension_tuples:
-        print("Failed to generate dimension tuples. Exiting.")
-        return
-    print(f"Generated {len(dimension_tuples)} dimension tuples.")
-    
-    # Step 2: Generate queries for each tuple
-    print("\nStep 2: Generating natural language queries...")
-    queries = generate_queries_parallel(dimension_tuples)
-    
-    if queries:
-        save_queries_to_csv(queries)
+
+    # Generate dimension tuples and their queries in fused calls, streaming
+    # each row to disk as it arrives
+    print("Generating dimension tuples and natural language queries...")
+    num_queries = await save_queries_to_csv(generate_queries_parallel())
+
+    if num_queries:
         elapsed_time = time.time() - start_time
         print(f"\nQuery generation completed successfully in {elapsed_time:.2f} seconds.")
-        print(f"Generated {len(queries)} queries from {len(dimension_tuples)} dimension tuples.")
+        print(f"Generated {num_queries} queries.")
     else:
         print("Failed to generate any queries.")
     
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
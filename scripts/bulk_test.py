@@ -16,6 +16,7 @@ endpoint concurrently, and stores the results for later manual evaluation.
 import argparse
 import csv
 import datetime as dt
+import uuid
 from typing import List, Tuple, Dict
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
@@ -43,18 +44,9 @@ MAX_WORKERS = 32 # For ThreadPoolExecutor
 # --- Sync function for ThreadPoolExecutor ---
 def process_query_sync(query_id: str, query: str) -> Tuple[str, str, str]:
     """Processes a single query by calling the agent directly."""
-    initial_messages: List[Dict[str, str]] = [
-        {"role": "user", "content": query}
-    ]
     try:
-        # get_agent_response now returns the full history
-        updated_history = get_agent_response(initial_messages)
-        # Extract the last assistant message for the result
-        assistant_reply = ""
-        if updated_history and updated_history[-1]["role"] == "assistant":
-            assistant_reply = updated_history[-1]["content"]
-        else: # Should not happen with current logic but good to handle
-            assistant_reply = "Error: No assistant reply found in history."
+        # Each query gets its own throwaway session so histories don't mix
+        assistant_reply = get_agent_response(str(uuid.uuid4()), query)
         return query_id, query, assistant_reply
     except Exception as e:
         return query_id, query, f"Error processing query: {str(e)}"
@@ -0,0 +1,23 @@
+"""Regression test for the shared system prompt.
+
+Provider prompt caching is keyed on the exact prompt bytes, so any edit to
+SYSTEM_PROMPT invalidates cached prefixes for the backend and every homework
+script that imports it. This hash pins the prompt; if you change the prompt
+on purpose, update the expected digest in the same commit.
+"""
+
+import hashlib
+import sys
+from pathlib import Path
+
+# Add project root to sys.path so the backend package is importable
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend.utils import SYSTEM_PROMPT
+
+EXPECTED_SHA256 = "5aff3620ada0675df2f572a1a6626f2292e4c6712e83352c96f89f75aea8f99c"
+
+
+def test_system_prompt_hash_is_stable() -> None:
+    assert hashlib.sha256(SYSTEM_PROMPT.encode("utf-8")).hexdigest() == EXPECTED_SHA256